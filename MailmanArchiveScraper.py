@@ -11,7 +11,8 @@
 from urllib2 import HTTPError
 import ClientForm, ConfigParser, datetime, email.utils, mechanize, os, PyRSS2Gen, re, sys, time, urlparse
 from BeautifulSoup import BeautifulSoup
-import errno
+import argparse, errno
+from ScrapeProfiler import ScrapeProfiler
 
 
 class FullRSSItem(PyRSS2Gen.RSSItem):
@@ -41,7 +42,7 @@ class MailmanArchiveScraper(object):
     Scrapes the archive pages of one or more lists in a Mailman installation and republishes the contents.
     """
     
-    def __init__(self, config_file=None):
+    def __init__(self, config_file=None, profile_dir=None, profile_objects=False):
         self.loadConfig(config_file)
 
         # We need to know if this is a public or private list.
@@ -66,6 +67,11 @@ class MailmanArchiveScraper(object):
         self.prepareRSS()
         
         self.prepareRegExps()
+
+        # Only set if we're profiling, so that normal runs are untouched.
+        self.profiler = None
+        if profile_dir:
+            self.prepareProfiler(profile_dir, profile_objects)
         
 
     def loadConfig(self, config_file=None):
@@ -177,13 +183,43 @@ class MailmanArchiveScraper(object):
         self.match_subject = re.compile(r'^(?:\[.*?\]\s+)?', re.IGNORECASE)
 
 
+    def prepareProfiler(self, profile_dir, profile_objects=False):
+        """
+        Replaces the methods for each phase of the scrape with profiled versions.
+        Reports will be saved in profile_dir.
+        If profile_objects is True, objects are counted too, which is much slower.
+        """
+        self.profiler = ScrapeProfiler(profile_dir, track_objects=profile_objects)
+
+        self.fetchPage = self.profiler.wrap('fetchPage', self.fetchPage, record_pages=True)
+        for phase in ['filterPage', 'scrapeMessage', 'publishRSS']:
+            setattr(self, phase, self.profiler.wrap(phase, getattr(self, phase)))
+
+
     def scrape(self):
-        if not self.public_list:
-            self.logIn()
+        try:
+            if not self.public_list:
+                self.logIn()
 
-        self.scrapeList()
+            self.scrapeList()
 
-        self.publishRSS()
+            self.publishRSS()
+        finally:
+            # Save what we've got, even if the scrape failed part way through.
+            if self.profiler:
+                self.saveProfile()
+
+
+    def saveProfile(self):
+        """
+        Saves the profiler's reports.
+        A failure here is only reported, so that it can't replace any error from the scrape.
+        """
+        self.message('Saving profile reports in ' + self.profiler.profile_dir)
+        try:
+            self.profiler.report()
+        except Exception as e:
+            self.error("Couldn't save profile reports in " + self.profiler.profile_dir + ": " + str(e), fatal=False)
         
     
     def prepareRSS(self):
@@ -603,11 +639,28 @@ class MailmanArchiveScraper(object):
         if fatal:
             exit()
 
-def main(configs=None):
+def main(configs=None, profile_dir=None, profile_objects=False):
     # absent any config files, use the built-in default indicated by None
     configs = configs or [None]
+    profile_names = set()
     for config_file in configs:
-        scraper = MailmanArchiveScraper(config_file=config_file)
+        config_profile_dir = None
+        if profile_dir:
+            # Each config's reports go in a directory named after its file,
+            # eg 'list-name' for list-name.cfg, with a number added if
+            # another config file has the same name.
+            name = os.path.splitext(os.path.basename(config_file or 'MailmanArchiveScraper.cfg'))[0]
+            unique_name = name
+            n = 2
+            while unique_name in profile_names:
+                unique_name = name + '-' + str(n)
+                n += 1
+            profile_names.add(unique_name)
+            config_profile_dir = os.path.join(profile_dir, unique_name)
+
+        scraper = MailmanArchiveScraper(config_file=config_file,
+                                        profile_dir=config_profile_dir,
+                                        profile_objects=profile_objects)
         scraper.scrape()
 
 def mkdir_p(path):
@@ -620,10 +673,27 @@ def mkdir_p(path):
         else: raise
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Scrape and republish Mailman list archives.')
+    parser.add_argument('configs', nargs='*', metavar='CONFIG',
+                        help='Config files to use, instead of MailmanArchiveScraper.cfg')
+    parser.add_argument('--profile', metavar='DIR', dest='profile_dir',
+                        help='Save profiling reports for each list in this directory')
+    parser.add_argument('--profile-objects', action='store_true',
+                        help='Also count objects by type when profiling (much slower)')
+    # parse_known_args() so that config files can come before and after the options.
+    (args, other_configs) = parser.parse_known_args()
+    for arg in other_configs:
+        if arg.startswith('-'):
+            parser.error('unrecognized argument: ' + arg)
+    if args.profile_objects and not args.profile_dir:
+        parser.error('--profile-objects can only be used with --profile')
+    config_files = args.configs + other_configs
+
     configs = None
-    if len(sys.argv) > 1:
-        configs = [f for f in map(os.path.realpath, set(sys.argv[1:])) if os.path.isfile(f)]
+    if config_files:
+        # Sorted, so that profile directory names are the same each time.
+        configs = [f for f in map(os.path.realpath, sorted(set(config_files))) if os.path.isfile(f)]
 
-    main(configs)
+    main(configs, profile_dir=args.profile_dir, profile_objects=args.profile_objects)
     
 
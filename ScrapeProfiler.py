@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Optional profiling for MailmanArchiveScraper, used with its --profile option.
+"""
+import cProfile, gc, os, sys, time, types
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.
+    resource = None
+
+
+def countObjects():
+    "Returns a dictionary of type name : number of objects of that type the garbage collector is tracking."
+    counts = {}
+    for obj in gc.get_objects():
+        obj_type = type(obj)
+        if obj_type is types.InstanceType:
+            # An instance of an old-style class, like BeautifulSoup's Tags.
+            obj_type = obj.__class__
+        if obj_type.__module__ == '__builtin__':
+            name = obj_type.__name__
+        else:
+            name = obj_type.__module__ + '.' + obj_type.__name__
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+class ScrapeProfiler(object):
+    """
+    Profiles the phases of a scrape: fetching pages, filtering them, processing
+    each message, and publishing the RSS feed.
+
+    Each phase gets its own cProfile stats. When phases are nested (eg,
+    fetchPage() within scrapeMessage()) the stats only count against the
+    innermost phase, although the wall-clock times include nested phases.
+
+    If the resource module is available we also record how much each phase
+    raised the process's peak memory use (its maximum resident set size),
+    including nested phases.
+
+    If track_objects is True we count the objects the garbage collector is
+    tracking, by type, whenever we enter or leave a phase, and record the net
+    change against the innermost phase. This is slow, but the time is left out
+    of the phase times. Only containers and class instances are tracked, so
+    strings aren't counted, and anything created and freed within a phase
+    (like a message's BeautifulSoup tree) won't appear.
+    """
+
+    def __init__(self, profile_dir, track_objects=False, top=20):
+        self.profile_dir = profile_dir
+        self.track_objects = track_objects
+
+        # How many lines to include in each list in the reports.
+        self.top = top
+
+        # Each of these is keyed by the name of the phase.
+        self.profiles = {}
+        self.calls = {}
+        self.times = {}
+        self.rss_growth = {}
+        # Each phase has a dictionary of type name : net change in number of objects.
+        self.objects = {}
+
+        # The names of the phases we're currently in, innermost last, and the
+        # maximum RSS when we entered each of them.
+        self.stack = []
+        self.stack_rss = []
+
+        # The time, size and URL of every page fetched. These are separate
+        # lists, rather than a list of tuples, so that they aren't counted as
+        # objects in any phase.
+        self.page_times = []
+        self.page_sizes = []
+        self.page_urls = []
+
+        # Time spent counting objects, which we leave out of the phase times.
+        self.overhead = 0.0
+
+        # The most recent object counts.
+        self.counts = {}
+
+
+    def wrap(self, phase, method, record_pages=False):
+        """
+        Returns a version of method that is profiled as part of phase.
+        If record_pages is True, the first argument should be the URL and
+        the method should return the page's source.
+        """
+        # Set everything up now, rather than while we're profiling.
+        self.profiles[phase] = cProfile.Profile()
+        self.calls[phase] = 0
+        self.times[phase] = 0.0
+        self.rss_growth[phase] = 0
+        self.objects[phase] = {}
+
+        def profiled(*args, **kwargs):
+            self.enterPhase(phase)
+            start = time.time()
+            overhead = self.overhead
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                elapsed = time.time() - start - (self.overhead - overhead)
+                self.leavePhase(phase, elapsed)
+            if record_pages:
+                self.page_times.append(elapsed)
+                self.page_sizes.append(len(result or ''))
+                self.page_urls.append(args[0])
+            return result
+        return profiled
+
+
+    def enterPhase(self, phase):
+        began = time.time()
+        if self.stack:
+            self.profiles[self.stack[-1]].disable()
+        self.recordObjects()
+
+        self.stack.append(phase)
+        self.stack_rss.append(self.maxRSS())
+        self.overhead += time.time() - began
+        self.profiles[phase].enable()
+
+
+    def leavePhase(self, phase, elapsed):
+        self.profiles[phase].disable()
+        began = time.time()
+        # Before counting objects, which can use a lot of memory itself.
+        self.rss_growth[phase] += self.maxRSS() - self.stack_rss.pop()
+        self.recordObjects()
+        self.stack.pop()
+
+        self.calls[phase] += 1
+        self.times[phase] += elapsed
+
+        self.overhead += time.time() - began
+        if self.stack:
+            self.profiles[self.stack[-1]].enable()
+
+
+    def maxRSS(self):
+        "The peak resident set size of this process so far, in KiB, or 0 if we can't tell."
+        if resource is None:
+            return 0
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            # Mac OS X reports bytes rather than kilobytes.
+            rss = rss / 1024
+        return rss
+
+
+    def recordObjects(self):
+        """
+        Adds the change in object counts since the previous call to the
+        innermost phase we're in. Called whenever we enter or leave a phase.
+        """
+        if not self.track_objects:
+            return
+
+        counts = countObjects()
+        if self.stack:
+            objects = self.objects[self.stack[-1]]
+            for name in set(counts) | set(self.counts):
+                change = counts.get(name, 0) - self.counts.get(name, 0)
+                if change:
+                    objects[name] = objects.get(name, 0) + change
+        self.counts = counts
+
+
+    def report(self):
+        """
+        Saves, in self.profile_dir:
+        * phase.prof - cProfile stats for each phase, for use with pstats.
+        * phase-objects.txt - The types of object whose numbers grew most in
+          each phase, if we're tracking objects.
+        * summary.txt - Time and memory used by each phase, the slowest URLs
+          and the largest pages.
+        """
+        if not os.path.isdir(self.profile_dir):
+            os.makedirs(self.profile_dir)
+
+        lines = ['%-15s %8s %12s %10s %14s' % ('Phase', 'Calls', 'Total (s)', 'Mean (s)', 'Max RSS + KiB')]
+        for phase in sorted(self.profiles):
+            self.profiles[phase].dump_stats(os.path.join(self.profile_dir, phase + '.prof'))
+            rss = '-'
+            if resource is not None:
+                rss = str(self.rss_growth[phase])
+            lines.append('%-15s %8d %12.3f %10.3f %14s' % (phase,
+                                                           self.calls[phase],
+                                                           self.times[phase],
+                                                           self.times[phase] / max(self.calls[phase], 1),
+                                                           rss))
+        lines.append('Times are wall-clock and include any nested phases.')
+        if resource is None:
+            lines.append('The resource module is not available, so memory use was not recorded.')
+        else:
+            lines.append("'Max RSS +' is how much the phase raised the process's peak memory use,")
+            lines.append('including any nested phases. Once memory has been used, later phases')
+            lines.append('only show an increase if they need more than that.')
+
+        pages = zip(self.page_times, self.page_sizes, self.page_urls)
+
+        lines += ['', 'Slowest URLs:']
+        for (seconds, size, url) in sorted(pages, reverse=True)[:self.top]:
+            lines.append('%8.3fs %10d bytes  %s' % (seconds, size, url))
+
+        lines += ['', 'Largest pages:']
+        for (seconds, size, url) in sorted(pages, key=lambda page: page[1], reverse=True)[:self.top]:
+            lines.append('%10d bytes %8.3fs  %s' % (size, seconds, url))
+
+        if self.track_objects:
+            for phase, objects in self.objects.iteritems():
+                top_types = sorted(objects.iteritems(), key=lambda item: item[1], reverse=True)[:self.top]
+                fp = open(os.path.join(self.profile_dir, phase + '-objects.txt'), 'w')
+                fp.write('Net change in the number of objects, by type, during %s.\n' % phase)
+                fp.write('Only objects tracked by the garbage collector are counted, and objects\n')
+                fp.write('created and freed within the phase are not included.\n\n')
+                fp.write('%10s  %s\n' % ('Objects', 'Type'))
+                for (name, count) in top_types:
+                    if count > 0:
+                        fp.write('%10d  %s\n' % (count, name))
+                fp.close()
+
+        fp = open(os.path.join(self.profile_dir, 'summary.txt'), 'w')
+        fp.write('\n'.join(lines) + '\n')
+        fp.close()